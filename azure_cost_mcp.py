@@ -1,89 +1,255 @@
 #!/usr/bin/env python3
-import json
+import functools
+import hashlib
+import os
 import subprocess
 import sys
-from datetime import date, timedelta
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 AZURE_API_VERSION = "2023-11-01"
+MAX_WORKERS = 16
+CACHE_DIR = Path.home() / ".cache" / "mcp-azure"
+TOKEN_MIN_REMAINING_SECONDS = 60
+SUBSCRIPTIONS_TTL_SECONDS = 600
+# Tool results are compact JSON; set MCP_PRETTY=1 to indent them for humans.
+RESULT_JSON_OPTION = orjson.OPT_INDENT_2 if os.environ.get("MCP_PRETTY") else 0
+
+MANAGEMENT_URL = "https://management.azure.com"
+COST_QUERY_PATH = f"/providers/Microsoft.CostManagement/query?api-version={AZURE_API_VERSION}"
+
+# Parts of the Cost Management query body that never change. Payloads are
+# built by shallow-copying these, so they must not be mutated.
+BASE_DATASET = {
+    "granularity": "None",
+    "aggregation": {"totalCost": {"name": "PreTaxCost", "function": "Sum"}},
+}
+BASE_COST_QUERY = {"type": "ActualCost", "timeframe": "Custom", "dataset": BASE_DATASET}
+TENANT_DATASET = {
+    **BASE_DATASET,
+    "grouping": [
+        {"type": "Dimension", "name": "SubscriptionId"},
+        {"type": "Dimension", "name": "SubscriptionName"},
+    ],
+}
 
 
 def run(cmd):
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return p.returncode, p.stdout.strip(), p.stderr.strip()
+    # stdout stays as bytes for orjson; only stderr is decoded, for messages.
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return p.returncode, p.stdout, p.stderr.decode("utf-8", "replace").strip()
+
+
+def _az_account_key():
+    # az records the active account in azureProfile.json. Keying the cache on
+    # its tenant and user means az login/logout/account set to another tenant
+    # or user misses. With no default account the cache is not used at all.
+    config_dir = Path(os.environ.get("AZURE_CONFIG_DIR") or Path.home() / ".azure")
+    try:
+        profile = orjson.loads((config_dir / "azureProfile.json").read_bytes().decode("utf-8-sig"))
+    except (OSError, ValueError):
+        return None
+    for s in profile.get("subscriptions", []):
+        if s.get("isDefault"):
+            tenant = s.get("tenantId")
+            user = (s.get("user") or {}).get("name")
+            if not tenant or not user:
+                return None
+            return hashlib.sha256(f"{tenant}\n{user}".encode("utf-8")).hexdigest()[:16]
+    return None
+
+
+def _cache_read(name):
+    if name is None:
+        return None
+    try:
+        return orjson.loads((CACHE_DIR / name).read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_write(name, obj):
+    if name is None:
+        return
+    # Best effort: write to a 0600 temp file and rename so readers never see a
+    # partial file. A failure just means the next call asks az again.
+    try:
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps(obj))
+            os.replace(tmp, CACHE_DIR / name)
+        except OSError:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+
+
+def _token_expiry(j):
+    if j.get("expires_on"):
+        return float(j["expires_on"])
+    # Older az versions only return expiresOn, in local time.
+    return datetime.fromisoformat(j["expiresOn"]).timestamp()
 
 
 def az_access_token(resource="https://management.azure.com/"):
+    resource_key = hashlib.sha256(resource.encode("utf-8")).hexdigest()[:16]
+    account_key = _az_account_key()
+    cache_name = f"token-{account_key}-{resource_key}.json" if account_key else None
+    cached = _cache_read(cache_name)
+    try:
+        if cached and _token_expiry(cached) - time.time() > TOKEN_MIN_REMAINING_SECONDS:
+            return cached["accessToken"]
+    except (KeyError, TypeError, ValueError):
+        pass
+
     code, out, err = run(["az", "account", "get-access-token", "--resource", resource, "-o", "json"])
     if code != 0:
         raise RuntimeError(f"Failed to get Azure access token. Run: az login\n{err}")
-    j = json.loads(out)
+    j = orjson.loads(out)
+    _cache_write(cache_name, j)
     return j["accessToken"]
 
 
 def az_subscriptions():
+    account_key = _az_account_key()
+    cache_name = f"subscriptions-{account_key}.json" if account_key else None
+    cached = _cache_read(cache_name)
+    if cached and time.time() - cached.get("fetchedAt", 0) < SUBSCRIPTIONS_TTL_SECONDS:
+        return cached["subscriptions"]
+
     code, out, err = run(["az", "account", "list", "-o", "json"])
     if code != 0:
         raise RuntimeError(f"Failed to list subscriptions.\n{err}")
-    subs = json.loads(out)
+    subs = orjson.loads(out)
     subs = [s for s in subs if s.get("state") == "Enabled"]
     subs.sort(key=lambda s: (s.get("name", ""), s.get("id", "")))
+    _cache_write(cache_name, {"fetchedAt": time.time(), "subscriptions": subs})
     return subs
 
 
+@functools.lru_cache(maxsize=1)
+def _last_full_month_range_for(ordinal):
+    today = date.fromordinal(ordinal)
+    y, m = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    last_month_end = date(today.year, today.month, 1) - timedelta(days=1)
+    return date(y, m, 1).isoformat(), last_month_end.isoformat()
+
+
 def last_full_month_range():
-    today = date.today()
-    first_this_month = date(today.year, today.month, 1)
-    last_month_end = first_this_month - timedelta(days=1)
-    last_month_start = date(last_month_end.year, last_month_end.month, 1)
-    return last_month_start.isoformat(), last_month_end.isoformat()
+    # The answer only changes once a day, so memoise on today's ordinal.
+    return _last_full_month_range_for(date.today().toordinal())
 
 
 def cost_query_payload(start_date, end_date):
-    return {
-        "type": "ActualCost",
-        "timeframe": "Custom",
-        "timePeriod": {"from": start_date, "to": end_date},
-        "dataset": {
-            "granularity": "None",
-            "aggregation": {"totalCost": {"name": "PreTaxCost", "function": "Sum"}},
-        },
-    }
+    return {**BASE_COST_QUERY, "timePeriod": {"from": start_date, "to": end_date}}
+
+
+def tenant_cost_query_payload(start_date, end_date):
+    return {**cost_query_payload(start_date, end_date), "dataset": TENANT_DATASET}
+
+
+@functools.lru_cache(maxsize=1)
+def http_session():
+    # One pooled keep-alive session for every Cost Management call; created on
+    # first use so MCP startup does not pay for it. The query API is read-only
+    # but uses POST and throttles concurrent callers, so POSTs are retried on
+    # 429/5xx, honouring Retry-After.
+    session = requests.Session()
+    session.headers["Content-Type"] = "application/json"
+    retry = Retry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=32, max_retries=retry))
+    return session
 
 
 def http_post_json(url, payload, token):
-    body = json.dumps(payload)
-    cmd = [
-        "curl", "-sS",
-        "-X", "POST",
-        url,
-        "-H", f"Authorization: Bearer {token}",
-        "-H", "Content-Type: application/json",
-        "--data-binary", body,
-    ]
-    code, out, err = run(cmd)
-    if code != 0:
-        raise RuntimeError(f"curl failed: {err}")
     try:
-        return json.loads(out)
-    except json.JSONDecodeError:
-        raise RuntimeError(f"Non-JSON response from Azure API:\n{out[:800]}")
+        resp = http_session().post(
+            url,
+            data=orjson.dumps(payload),
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=60,
+        )
+    except requests.RequestException as ex:
+        raise RuntimeError(f"HTTP request failed: {ex}")
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Azure API error {resp.status_code}:\n{resp.text[:800]}")
+    try:
+        return orjson.loads(resp.content)
+    except orjson.JSONDecodeError:
+        raise RuntimeError(f"Non-JSON response from Azure API:\n{resp.text[:800]}")
 
 
 def query_subscription_cost(subscription_id, start_date, end_date, token):
     scope = f"/subscriptions/{subscription_id}"
-    url = f"https://management.azure.com{scope}/providers/Microsoft.CostManagement/query?api-version={AZURE_API_VERSION}"
+    url = MANAGEMENT_URL + scope + COST_QUERY_PATH
     payload = cost_query_payload(start_date, end_date)
     return http_post_json(url, payload, token)
 
 
+def query_tenant_cost(tenant_id, start_date, end_date, token):
+    # The tenant root management group has the same id as the tenant, so one
+    # query grouped by SubscriptionId covers every subscription in it.
+    scope = f"/providers/Microsoft.Management/managementGroups/{tenant_id}"
+    url = MANAGEMENT_URL + scope + COST_QUERY_PATH
+    payload = tenant_cost_query_payload(start_date, end_date)
+    result = http_post_json(url, payload, token)
+    props = result.setdefault("properties", {})
+    next_link = props.get("nextLink")
+    while next_link:
+        page = http_post_json(next_link, payload, token).get("properties", {})
+        props.setdefault("rows", []).extend(page.get("rows", []))
+        next_link = page.get("nextLink")
+    return result
+
+
+def parse_subscription_costs(result_json):
+    """Map lower-cased subscription id -> (cost, currency) from a tenant query."""
+    props = result_json.get("properties", {})
+    rows = props.get("rows", [])
+    cols = props.get("columns", [])
+    idx = {c.get("name"): i for i, c in enumerate(cols)}
+    sid_idx = idx.get("SubscriptionId")
+    if sid_idx is None:
+        raise RuntimeError("Tenant cost query returned no SubscriptionId column.")
+    cost_idx = idx.get("PreTaxCost", 0)
+    cur_idx = idx.get("Currency")
+    costs = {}
+    for row in rows:
+        sid = str(row[sid_idx]).lower()
+        cost = float(row[cost_idx]) if row[cost_idx] is not None else 0.0
+        cur = row[cur_idx] if cur_idx is not None and cur_idx < len(row) else None
+        prev_cost, prev_cur = costs.get(sid, (0.0, None))
+        costs[sid] = (prev_cost + cost, cur or prev_cur)
+    return costs
+
+
 def parse_total_cost(result_json):
     props = result_json.get("properties", {})
     rows = props.get("rows", [])
     cols = props.get("columns", [])
     if not rows:
         return 0.0, None
-    cost_idx = next((i for i, c in enumerate(cols) if c.get("name") == "PreTaxCost"), 0)
-    cur_idx = next((i for i, c in enumerate(cols) if c.get("name") == "Currency"), None)
+    idx = {c.get("name"): i for i, c in enumerate(cols)}
+    cost_idx = idx.get("PreTaxCost", 0)
+    cur_idx = idx.get("Currency")
     row = rows[0]
     cost = float(row[cost_idx]) if row[cost_idx] is not None else 0.0
     cur = row[cur_idx] if cur_idx is not None and cur_idx < len(row) else None
@@ -93,15 +259,15 @@ def parse_total_cost(result_json):
 TOOLS = [
     {
         "name": "azure_cost_last_full_month_all_subscriptions",
-        "description": "Return actual cost for the last full calendar month for every Enabled subscription you can access. Requires Cost Management Reader on each subscription.",
+        "description": "Return actual cost for the last full calendar month for every Enabled subscription you can access. Requires Cost Management Reader on the tenant root management group or on each subscription.",
         "inputSchema": {"type": "object", "properties": {}, "additionalProperties": False},
     }
 ]
 
 
 def mcp_send(obj):
-    sys.stdout.write(json.dumps(obj) + "\n")
-    sys.stdout.flush()
+    sys.stdout.buffer.write(orjson.dumps(obj) + b"\n")
+    sys.stdout.buffer.flush()
 
 
 def handle_tools_list():
@@ -121,50 +287,87 @@ def handle_tools_call(msg):
     results = []
     errors = []
 
+    def add_result(s, cost, cur):
+        results.append(
+            {
+                "subscriptionName": s.get("name"),
+                "subscriptionId": s.get("id"),
+                "cost": round(cost, 2),
+                "currency": cur,
+                "periodStart": start_date,
+                "periodEnd": end_date,
+            }
+        )
+
+    by_tenant = {}
     for s in subs:
-        sid = s.get("id")
-        sname = s.get("name")
+        by_tenant.setdefault(s.get("tenantId"), []).append(s)
+
+    # One grouped query per tenant; subscriptions in tenants where that is not
+    # permitted (typically 403 at the root management group), or that have no
+    # row in the grouped result, are queried individually instead.
+    per_sub = []
+    for tenant_id, tenant_subs in by_tenant.items():
+        if not tenant_id:
+            per_sub.extend(tenant_subs)
+            continue
         try:
-            r = query_subscription_cost(sid, start_date, end_date, token)
-            cost, cur = parse_total_cost(r)
-            results.append(
-                {
-                    "subscriptionName": sname,
-                    "subscriptionId": sid,
-                    "cost": round(cost, 2),
-                    "currency": cur,
-                    "periodStart": start_date,
-                    "periodEnd": end_date,
-                }
-            )
-        except Exception as ex:
-            errors.append(
-                {
-                    "subscriptionName": sname,
-                    "subscriptionId": sid,
-                    "error": str(ex)[:500],
-                }
-            )
+            costs = parse_subscription_costs(query_tenant_cost(tenant_id, start_date, end_date, token))
+        except Exception:
+            per_sub.extend(tenant_subs)
+            continue
+        for s in tenant_subs:
+            sub_cost = costs.get(str(s.get("id")).lower())
+            if sub_cost is None:
+                # No row could mean no spend or a subscription the management
+                # group query does not cover; ask for it directly.
+                per_sub.append(s)
+            else:
+                add_result(s, *sub_cost)
+
+    # Create the shared session here: lru_cache does not serialise a miss, so
+    # workers racing on first use would each build their own.
+    http_session()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(query_subscription_cost, s.get("id"), start_date, end_date, token): s
+            for s in per_sub
+        }
+        for fut in as_completed(futures):
+            s = futures[fut]
+            try:
+                cost, cur = parse_total_cost(fut.result())
+                add_result(s, cost, cur)
+            except Exception as ex:
+                errors.append(
+                    {
+                        "subscriptionName": s.get("name"),
+                        "subscriptionId": s.get("id"),
+                        "error": str(ex)[:500],
+                    }
+                )
 
     results.sort(key=lambda x: x["cost"], reverse=True)
+    errors.sort(key=lambda x: (x["subscriptionName"] or "", x["subscriptionId"] or ""))
 
     mcp_send(
         {
             "content": [
                 {
                     "type": "text",
-                    "text": json.dumps(
+                    "text": orjson.dumps(
                         {
                             "period": {"from": start_date, "to": end_date},
                             "subscriptions": results,
                             "errors": errors,
                             "notes": [
+                                "Costs come from one query per tenant root management group when you have Cost Management Reader there; subscriptions missing from that result, or in other tenants, are queried one by one.",
                                 "403 errors mean you do not have Cost Management Reader on that subscription.",
                                 "This is actual billed cost (PreTaxCost) from Cost Management Query API.",
                             ],
                         },
-                        indent=2,
-                    ),
+                        option=RESULT_JSON_OPTION,
+                    ).decode(),
                 }
             ]
         }
@@ -172,13 +375,14 @@ def handle_tools_call(msg):
 
 
 def main():
-    for line in sys.stdin:
-        line = line.strip()
-        if not line:
+    # Read raw bytes and hand them straight to orjson (which skips surrounding
+    # whitespace) instead of decoding and stripping every line first.
+    for line in sys.stdin.buffer:
+        if line.isspace():
             continue
         try:
-            msg = json.loads(line)
-        except Exception:
+            msg = orjson.loads(line)
+        except orjson.JSONDecodeError:
             mcp_send({"error": "Invalid JSON"})
             continue
 
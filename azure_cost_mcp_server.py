@@ -8,54 +8,158 @@ Tools:
 
 Auth:
 - Uses your existing `az login` token (no secrets)
+- The token and subscription list are cached under ~/.cache/mcp-azure
 
 RBAC:
 - Cost Management Reader on each subscription you want included
 """
 
-import json
+import functools
+import hashlib
+import os
 import subprocess
-from datetime import date, timedelta
-from typing import Any, Dict, List, Tuple
-
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import requests
 from mcp.server.fastmcp import FastMCP
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 AZURE_API_VERSION = "2023-11-01"
+MAX_WORKERS = 16
+CACHE_DIR = Path.home() / ".cache" / "mcp-azure"
+TOKEN_MIN_REMAINING_SECONDS = 60
+SUBSCRIPTIONS_TTL_SECONDS = 600
+
+MANAGEMENT_URL = "https://management.azure.com"
+COST_QUERY_PATH = f"/providers/Microsoft.CostManagement/query?api-version={AZURE_API_VERSION}"
+
+# Parts of the Cost Management query body that never change. Payloads are
+# built by shallow-copying these, so they must not be mutated.
+BASE_DATASET: Dict[str, Any] = {
+    "granularity": "None",
+    "aggregation": {"totalCost": {"name": "PreTaxCost", "function": "Sum"}},
+}
+BASE_COST_QUERY: Dict[str, Any] = {"type": "ActualCost", "timeframe": "Custom", "dataset": BASE_DATASET}
 
 mcp = FastMCP("azure-costing")
 
 
-def run(cmd: List[str]) -> Tuple[int, str, str]:
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return p.returncode, p.stdout.strip(), p.stderr.strip()
+def run(cmd: List[str]) -> Tuple[int, bytes, str]:
+    # stdout stays as bytes for orjson; only stderr is decoded, for messages.
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return p.returncode, p.stdout, p.stderr.decode("utf-8", "replace").strip()
+
+
+def _az_account_key() -> Optional[str]:
+    # az records the active account in azureProfile.json. Keying the cache on
+    # its tenant and user means az login/logout/account set to another tenant
+    # or user misses. With no default account the cache is not used at all.
+    config_dir = Path(os.environ.get("AZURE_CONFIG_DIR") or Path.home() / ".azure")
+    try:
+        profile = orjson.loads((config_dir / "azureProfile.json").read_bytes().decode("utf-8-sig"))
+    except (OSError, ValueError):
+        return None
+    for s in profile.get("subscriptions", []):
+        if s.get("isDefault"):
+            tenant = s.get("tenantId")
+            user = (s.get("user") or {}).get("name")
+            if not tenant or not user:
+                return None
+            return hashlib.sha256(f"{tenant}\n{user}".encode("utf-8")).hexdigest()[:16]
+    return None
+
+
+def _cache_read(name: Optional[str]) -> Any:
+    if name is None:
+        return None
+    try:
+        return orjson.loads((CACHE_DIR / name).read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_write(name: Optional[str], obj: Any) -> None:
+    if name is None:
+        return
+    # Best effort: write to a 0600 temp file and rename so readers never see a
+    # partial file. A failure just means the next call asks az again.
+    try:
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps(obj))
+            os.replace(tmp, CACHE_DIR / name)
+        except OSError:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+
+
+def _token_expiry(j: Dict[str, Any]) -> float:
+    if j.get("expires_on"):
+        return float(j["expires_on"])
+    # Older az versions only return expiresOn, in local time.
+    return datetime.fromisoformat(j["expiresOn"]).timestamp()
 
 
 def az_access_token(resource: str = "https://management.azure.com/") -> str:
+    resource_key = hashlib.sha256(resource.encode("utf-8")).hexdigest()[:16]
+    account_key = _az_account_key()
+    cache_name = f"token-{account_key}-{resource_key}.json" if account_key else None
+    cached = _cache_read(cache_name)
+    try:
+        if cached and _token_expiry(cached) - time.time() > TOKEN_MIN_REMAINING_SECONDS:
+            return cached["accessToken"]
+    except (KeyError, TypeError, ValueError):
+        pass
+
     code, out, err = run(
         ["az", "account", "get-access-token", "--resource", resource, "-o", "json"]
     )
     if code != 0:
         raise RuntimeError("Failed to get Azure access token. Run `az login`.\n" + err)
-    j = json.loads(out)
+    j = orjson.loads(out)
+    _cache_write(cache_name, j)
     return j["accessToken"]
 
 
 def az_subscriptions() -> List[Dict[str, Any]]:
+    account_key = _az_account_key()
+    cache_name = f"subscriptions-{account_key}.json" if account_key else None
+    cached = _cache_read(cache_name)
+    if cached and time.time() - cached.get("fetchedAt", 0) < SUBSCRIPTIONS_TTL_SECONDS:
+        return cached["subscriptions"]
+
     code, out, err = run(["az", "account", "list", "-o", "json"])
     if code != 0:
         raise RuntimeError("Failed to list subscriptions.\n" + err)
-    subs = json.loads(out)
+    subs = orjson.loads(out)
     subs = [s for s in subs if s.get("state") == "Enabled"]
     subs.sort(key=lambda s: (s.get("name", ""), s.get("id", "")))
+    _cache_write(cache_name, {"fetchedAt": time.time(), "subscriptions": subs})
     return subs
 
 
+@functools.lru_cache(maxsize=1)
+def _last_full_month_range_for(ordinal: int) -> Tuple[str, str]:
+    today = date.fromordinal(ordinal)
+    y, m = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    last_month_end = date(today.year, today.month, 1) - timedelta(days=1)
+    return date(y, m, 1).isoformat(), last_month_end.isoformat()
+
+
 def last_full_month_range() -> Tuple[str, str]:
-    today = date.today()
-    first_this_month = date(today.year, today.month, 1)
-    last_month_end = first_this_month - timedelta(days=1)
-    last_month_start = date(last_month_end.year, last_month_end.month, 1)
-    return last_month_start.isoformat(), last_month_end.isoformat()
+    # The answer only changes once a day, so memoise on today's ordinal.
+    return _last_full_month_range_for(date.today().toordinal())
 
 
 def cost_query_payload(
@@ -64,59 +168,65 @@ def cost_query_payload(
     group_by: List[str] | None = None,
     top: int | None = None,
 ) -> Dict[str, Any]:
-    group_by = group_by or []
-    groupings = [{"type": "Dimension", "name": g} for g in group_by]
+    payload = {**BASE_COST_QUERY, "timePeriod": {"from": start_date, "to": end_date}}
+    if not group_by and top is None:
+        return payload
 
-    dataset: Dict[str, Any] = {
-        "granularity": "None",
-        "aggregation": {"totalCost": {"name": "PreTaxCost", "function": "Sum"}},
-    }
+    dataset = dict(BASE_DATASET)
 
-    if groupings:
-        dataset["grouping"] = groupings
+    if group_by:
+        dataset["grouping"] = [{"type": "Dimension", "name": g} for g in group_by]
 
     if top is not None:
         dataset["sorting"] = [{"direction": "descending", "name": "PreTaxCost"}]
         dataset["top"] = top
 
-    return {
-        "type": "ActualCost",
-        "timeframe": "Custom",
-        "timePeriod": {"from": start_date, "to": end_date},
-        "dataset": dataset,
-    }
+    payload["dataset"] = dataset
+    return payload
+
+
+@functools.lru_cache(maxsize=1)
+def http_session() -> requests.Session:
+    # One pooled keep-alive session for every Cost Management call; created on
+    # first use so MCP startup does not pay for it. The query API is read-only
+    # but uses POST and throttles concurrent callers, so POSTs are retried on
+    # 429/5xx, honouring Retry-After.
+    session = requests.Session()
+    session.headers["Content-Type"] = "application/json"
+    retry = Retry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=32, max_retries=retry))
+    return session
 
 
 def http_post_json(url: str, payload: Dict[str, Any], token: str) -> Dict[str, Any]:
-    body = json.dumps(payload)
-    cmd = [
-        "curl",
-        "-sS",
-        "-X",
-        "POST",
-        url,
-        "-H",
-        f"Authorization: Bearer {token}",
-        "-H",
-        "Content-Type: application/json",
-        "--data-binary",
-        body,
-    ]
-    code, out, err = run(cmd)
-    if code != 0:
-        raise RuntimeError("curl failed: " + err)
+    try:
+        resp = http_session().post(
+            url,
+            data=orjson.dumps(payload),
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=60,
+        )
+    except requests.RequestException as ex:
+        raise RuntimeError("HTTP request failed: " + str(ex))
+
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Azure API error {resp.status_code}:\n" + resp.text[:800])
 
     try:
-        return json.loads(out)
-    except json.JSONDecodeError:
-        raise RuntimeError("Non-JSON response from Azure API:\n" + out[:800])
+        return orjson.loads(resp.content)
+    except orjson.JSONDecodeError:
+        raise RuntimeError("Non-JSON response from Azure API:\n" + resp.text[:800])
 
 
 def query_cost(scope: str, payload: Dict[str, Any], token: str) -> Dict[str, Any]:
-    url = (
-        f"https://management.azure.com{scope}"
-        f"/providers/Microsoft.CostManagement/query?api-version={AZURE_API_VERSION}"
-    )
+    url = MANAGEMENT_URL + scope + COST_QUERY_PATH
     return http_post_json(url, payload, token)
 
 
@@ -130,13 +240,8 @@ def parse_rows(result_json: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[
     rows = props.get("rows", [])
 
     col_names = [c.get("name") for c in cols]
-    out_rows = []
-    for r in rows:
-        d = {}
-        for i, name in enumerate(col_names):
-            if i < len(r):
-                d[name] = r[i]
-        out_rows.append(d)
+    # zip stops at the shorter side, so short rows simply omit trailing columns
+    out_rows = [dict(zip(col_names, r)) for r in rows]
     return out_rows, col_names
 
 
@@ -154,41 +259,48 @@ def azure_cost_last_full_month_all_subscriptions() -> Dict[str, Any]:
     results = []
     errors = []
 
-    for s in subs:
-        sid = s.get("id")
-        sname = s.get("name")
-        try:
-            scope = f"/subscriptions/{sid}"
-            payload = cost_query_payload(start_date, end_date)
-            r = query_cost(scope, payload, token)
-            rows, _ = parse_rows(r)
-
-            # With no grouping, expect 1 row with PreTaxCost + Currency
-            if rows:
-                cost = float(rows[0].get("PreTaxCost", 0) or 0)
-                cur = rows[0].get("Currency", "")
-            else:
-                cost = 0.0
-                cur = ""
-
-            results.append(
-                {
-                    "subscriptionName": sname,
-                    "subscriptionId": sid,
-                    "cost": round(cost, 2),
-                    "currency": cur,
-                }
-            )
-        except Exception as ex:
-            errors.append(
-                {
-                    "subscriptionName": sname,
-                    "subscriptionId": sid,
-                    "error": str(ex)[:500],
-                }
-            )
+    # Same body for every subscription; it is only read when serialized.
+    payload = cost_query_payload(start_date, end_date)
+
+    def subscription_total(sid: str) -> Tuple[float, str]:
+        r = query_cost(f"/subscriptions/{sid}", payload, token)
+        rows, _ = parse_rows(r)
+
+        # With no grouping, expect 1 row with PreTaxCost + Currency
+        if rows:
+            return float(rows[0].get("PreTaxCost", 0) or 0), rows[0].get("Currency", "")
+        return 0.0, ""
+
+    # Create the shared session here: lru_cache does not serialise a miss, so
+    # workers racing on first use would each build their own.
+    http_session()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(subscription_total, s.get("id")): s for s in subs}
+        for fut in as_completed(futures):
+            s = futures[fut]
+            sid = s.get("id")
+            sname = s.get("name")
+            try:
+                cost, cur = fut.result()
+                results.append(
+                    {
+                        "subscriptionName": sname,
+                        "subscriptionId": sid,
+                        "cost": round(cost, 2),
+                        "currency": cur,
+                    }
+                )
+            except Exception as ex:
+                errors.append(
+                    {
+                        "subscriptionName": sname,
+                        "subscriptionId": sid,
+                        "error": str(ex)[:500],
+                    }
+                )
 
     results.sort(key=lambda x: x["cost"], reverse=True)
+    errors.sort(key=lambda x: (x["subscriptionName"] or "", x["subscriptionId"] or ""))
 
     return {
         "period": {"from": start_date, "to": end_date},
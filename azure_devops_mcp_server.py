@@ -20,12 +20,16 @@ Example:
 """
 
 import os
-import json
 import base64
+import functools
 import urllib.parse
-from typing import Any, Dict, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, List, Tuple
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- MCP (FastMCP) ---
 # The official Python MCP package is commonly "mcp".
@@ -42,6 +46,9 @@ except Exception as e:
 
 mcp = FastMCP("azure-devops")
 
+# oldObjectId for a ref that does not exist yet
+ZERO_OBJECT_ID = "0000000000000000000000000000000000000000"
+
 
 def _env(name: str) -> str:
     v = os.getenv(name)
@@ -60,9 +67,10 @@ def _pat() -> str:
     return _env("AZDO_PAT")
 
 
-def _headers() -> Dict[str, str]:
+@functools.lru_cache(maxsize=4)
+def _headers_for_pat(pat: str) -> Dict[str, str]:
     # Azure DevOps: Basic base64(:PAT)
-    token = base64.b64encode(f":{_pat()}".encode("utf-8")).decode("utf-8")
+    token = base64.b64encode(f":{pat}".encode("utf-8")).decode("utf-8")
     return {
         "Authorization": f"Basic {token}",
         "Content-Type": "application/json",
@@ -71,23 +79,53 @@ def _headers() -> Dict[str, str]:
     }
 
 
-def _request(method: str, url: str, **kwargs) -> Any:
+def _headers() -> Dict[str, str]:
+    # Shared cached dict: callers must copy before modifying.
+    return _headers_for_pat(_pat())
+
+
+@functools.lru_cache(maxsize=1)
+def _session() -> requests.Session:
+    # Shared keep-alive session so a multi-call workflow reuses one connection
+    # to the org. Idempotent requests are retried on throttling/5xx.
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+
+def _request(method: str, url: str, stream_text: bool = False, **kwargs) -> Any:
+    """
+    stream_text: return the raw body as text, decoded incrementally, instead of
+    parsing it as JSON (for endpoints that send raw content, e.g. file items).
+    """
     h = kwargs.pop("headers", {})
     headers = {**_headers(), **h}
-    resp = requests.request(method, url, headers=headers, timeout=60, **kwargs)
+    if "json" in kwargs:
+        kwargs["data"] = orjson.dumps(kwargs.pop("json"))
+    resp = _session().request(method, url, headers=headers, timeout=60, stream=stream_text, **kwargs)
     if resp.status_code >= 400:
         # Provide helpful error
         try:
-            body = resp.json()
+            body = orjson.loads(resp.content)
         except Exception:
             body = resp.text
         raise RuntimeError(
             f"Azure DevOps API error {resp.status_code}\nURL: {url}\nResponse: {body}"
         )
-    if resp.text.strip() == "":
+    if stream_text:
+        # Raw file bodies usually come back without a charset
+        resp.encoding = resp.encoding or "utf-8"
+        return "".join(resp.iter_content(chunk_size=65536, decode_unicode=True))
+    if not resp.content.strip():
         return None
     try:
-        return resp.json()
+        return orjson.loads(resp.content)
     except Exception:
         return resp.text
 
@@ -156,15 +194,16 @@ def azdo_get_file(project: str, repo: str, path: str, branch: str = "refs/heads/
     repo_enc = urllib.parse.quote(repo)
     path_enc = urllib.parse.quote(path)
 
-    # Items API
+    # Items API, asking for the raw file rather than a JSON envelope around it
     url = (
         f"{_org_url()}/{project_enc}/_apis/git/repositories/{repo_enc}/items"
-        f"?path={path_enc}&includeContent=true&versionDescriptor.versionType=branch"
+        f"?path={path_enc}&%24format=octetStream&versionDescriptor.versionType=branch"
         f"&versionDescriptor.version={urllib.parse.quote(branch.replace('refs/heads/',''))}"
         f"&api-version=7.1-preview.1"
     )
-    data = _request("GET", url)
-    content = data.get("content", "")
+    content = _request(
+        "GET", url, stream_text=True, headers={"Accept": "application/octet-stream"}
+    )
     return {"path": path, "branch": branch, "content": content}
 
 
@@ -175,16 +214,27 @@ def _get_repo(project: str, repo: str) -> Dict[str, Any]:
     return _request("GET", url)
 
 
-def _get_ref_object_id(project: str, repo_id: str, ref_name: str) -> str:
-    # ref_name must be like refs/heads/main
+@functools.lru_cache(maxsize=256)
+def _get_repo_cached(project: str, repo: str) -> Tuple[str, str]:
+    # Repo ids are stable, so resolve each (project, repo) once per process.
+    # Callers clear the cache on a 404, e.g. after a repo is recreated.
+    obj = _get_repo(project, repo)
+    return obj["id"], obj.get("name")
+
+
+def _get_ref_object_id(project: str, repo: str, ref_name: str) -> str:
+    # ref_name must be like refs/heads/main; repo may be a name or an id
     project_enc = urllib.parse.quote(project)
+    repo_enc = urllib.parse.quote(repo)
     url = (
-        f"{_org_url()}/{project_enc}/_apis/git/repositories/{repo_id}/refs"
-        f"?filter={urllib.parse.quote(ref_name)}&api-version=7.1-preview.1"
+        f"{_org_url()}/{project_enc}/_apis/git/repositories/{repo_enc}/refs"
+        f"?filter={urllib.parse.quote(ref_name)}&%24top=1&api-version=7.1-preview.1"
     )
+    # filter is a prefix match and refs come back sorted by name, so an exact
+    # match is always first; one result is enough to answer the lookup.
     data = _request("GET", url)
     vals = data.get("value", [])
-    if not vals:
+    if not vals or vals[0].get("name") != ref_name:
         raise RuntimeError(f"Ref not found: {ref_name}")
     return vals[0].get("objectId")
 
@@ -246,44 +296,65 @@ def azdo_update_file_and_create_pr(
       new_branch: e.g. feature/my-change
       pr_description: optional description
     """
-    repo_obj = _get_repo(project, repo)
-    repo_id = repo_obj["id"]
-
     base_ref = f"refs/heads/{base_branch}"
     source_ref = f"refs/heads/{new_branch}"
 
-    base_object_id = _get_ref_object_id(project, repo_id, base_ref)
+    # Create the shared session here: lru_cache does not serialise a miss, so
+    # workers racing on first use would each build their own.
+    _session()
+
+    # The refs API accepts the repo name as well as its id, so the repo lookup
+    # and both ref lookups are independent and can run concurrently.
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        repo_future = pool.submit(_get_repo_cached, project, repo)
+        base_future = pool.submit(_get_ref_object_id, project, repo, base_ref)
+        source_future = pool.submit(_get_ref_object_id, project, repo, source_ref)
+
+        repo_id, repo_name = repo_future.result()
+        base_object_id = base_future.result()
+        try:
+            existing_source_object_id = source_future.result()
+        except Exception:
+            existing_source_object_id = None
 
-    # Create the branch ref pointing to base (if it doesn't exist)
-    # If it exists, we will update it to base (safe default).
+    # A new branch is created by the push itself (oldObjectId all zeros, commit
+    # parented on base). An existing branch is first reset to base (force) so
+    # the result is deterministic; that needs its own ref update unless it
+    # already points at base.
     try:
-        existing_source_object_id = _get_ref_object_id(project, repo_id, source_ref)
-        # Update branch to base (force) so it's deterministic
-        _create_or_update_ref(project, repo_id, source_ref, existing_source_object_id, base_object_id)
-    except Exception:
-        # Create new ref (oldObjectId is all zeros)
-        _create_or_update_ref(project, repo_id, source_ref, "0000000000000000000000000000000000000000", base_object_id)
-
-    # Now push a commit on that branch updating the file
-    push = _create_push(
-        project,
-        repo_id,
-        ref_updates=[{
-            "name": source_ref,
-            "oldObjectId": base_object_id
-        }],
-        commits=[{
-            "comment": pr_title,
-            "changes": [{
-                "changeType": "edit",
-                "item": {"path": file_path},
-                "newContent": {
-                    "content": new_content,
-                    "contentType": "rawtext"
-                }
+        if not existing_source_object_id:
+            push_old_object_id = ZERO_OBJECT_ID
+        else:
+            if existing_source_object_id != base_object_id:
+                _create_or_update_ref(project, repo_id, source_ref, existing_source_object_id, base_object_id)
+            push_old_object_id = base_object_id
+
+        # Now push a commit on that branch updating the file
+        push = _create_push(
+            project,
+            repo_id,
+            ref_updates=[{
+                "name": source_ref,
+                "oldObjectId": push_old_object_id
+            }],
+            commits=[{
+                "comment": pr_title,
+                "parents": [base_object_id],
+                "changes": [{
+                    "changeType": "edit",
+                    "item": {"path": file_path},
+                    "newContent": {
+                        "content": new_content,
+                        "contentType": "rawtext"
+                    }
+                }]
             }]
-        }]
-    )
+        )
+    except RuntimeError as ex:
+        # The cached repo id may be stale; re-resolve it on the next call
+        if "API error 404" in str(ex):
+            _get_repo_cached.cache_clear()
+        raise
 
     pr = _create_pr(
         project=project,
@@ -295,7 +366,7 @@ def azdo_update_file_and_create_pr(
     )
 
     return {
-        "repo": {"id": repo_id, "name": repo_obj.get("name")},
+        "repo": {"id": repo_id, "name": repo_name},
         "baseRef": base_ref,
         "sourceRef": source_ref,
         "pushId": push.get("pushId"),
@@ -16,24 +16,32 @@ Add to Claude Code:
 
 Tools:
 - confluence_get_page_by_title(space_key, title)
+- confluence_get_pages_by_titles(space_key, titles)
 - confluence_create_page(space_key, title, content_markdown, parent_id=None)
-- confluence_overwrite_page(page_id, title, content_markdown)
+- confluence_overwrite_page(page_id, title, content_markdown, known_version=None)
 
 Fix included:
 - URL-encode the title in confluence_get_page_by_title so punctuation like "–" works.
 """
 
 import base64
-import json
+import functools
 import os
-import subprocess
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import quote
 
+import orjson
+import requests
 from mcp.server.fastmcp import FastMCP
+from requests.adapters import HTTPAdapter
 
 mcp = FastMCP("confluence")
 
+# Titles OR-ed into one CQL query; keeps the URL and result page small.
+CQL_TITLES_PER_SEARCH = 25
+# Leaves room for near-miss title matches alongside the exact ones.
+CQL_SEARCH_LIMIT = 100
+
 
 def _require_env(name: str) -> str:
     v = os.environ.get(name, "").strip()
@@ -42,7 +50,9 @@ def _require_env(name: str) -> str:
     return v
 
 
-def _auth_header() -> str:
+@functools.lru_cache(maxsize=1)
+def _auth_header() -> Tuple[str, Dict[str, str]]:
+    # Pure function of the environment, so compute it once per process.
     base = _require_env("CONFLUENCE_BASE_URL").rstrip("/")
     email = _require_env("CONFLUENCE_EMAIL")
     token = _require_env("CONFLUENCE_API_TOKEN")
@@ -50,41 +60,42 @@ def _auth_header() -> str:
     # Atlassian: Basic base64(email:token)
     raw = f"{email}:{token}".encode("utf-8")
     b64 = base64.b64encode(raw).decode("utf-8")
-    return base, f"Authorization: Basic {b64}"
+    return base, {"Authorization": f"Basic {b64}"}
 
 
-def run(cmd: List[str]) -> Tuple[int, str, str]:
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return p.returncode, p.stdout.strip(), p.stderr.strip()
+@functools.lru_cache(maxsize=1)
+def http_session() -> requests.Session:
+    # One pooled keep-alive session for every Confluence call; created on
+    # first use so MCP startup does not pay for it.
+    session = requests.Session()
+    session.headers["Accept"] = "application/json"
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+    return session
 
 
 def http_json(
     method: str,
     url: str,
-    headers: List[str],
+    headers: Dict[str, str],
     payload: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
-    cmd = ["curl", "-sS", "-X", method, url]
-    for h in headers:
-        cmd += ["-H", h]
-    cmd += ["-H", "Accept: application/json"]
-
+    data = None
     if payload is not None:
-        cmd += [
-            "-H",
-            "Content-Type: application/json",
-            "--data-binary",
-            json.dumps(payload),
-        ]
+        headers = {**headers, "Content-Type": "application/json"}
+        data = orjson.dumps(payload)
+
+    try:
+        resp = http_session().request(method, url, headers=headers, data=data, timeout=60)
+    except requests.RequestException as ex:
+        raise RuntimeError(f"HTTP request failed: {ex}")
 
-    code, out, err = run(cmd)
-    if code != 0:
-        raise RuntimeError(f"curl failed: {err}")
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Confluence API error {resp.status_code}:\n{resp.text[:800]}")
 
     try:
-        return json.loads(out) if out else {}
-    except json.JSONDecodeError:
-        raise RuntimeError(f"Non-JSON response from Confluence:\n{out[:800]}")
+        return orjson.loads(resp.content) if resp.content.strip() else {}
+    except orjson.JSONDecodeError:
+        raise RuntimeError(f"Non-JSON response from Confluence:\n{resp.text[:800]}")
 
 
 def md_to_confluence_storage(md: str) -> str:
@@ -97,10 +108,63 @@ def md_to_confluence_storage(md: str) -> str:
 
     We'll use <pre> for reliability.
     """
+    # Chained str.replace is the fastest escape in CPython: each pass is a
+    # C-level search and returns the input unchanged when there is no match.
+    # str.translate with multi-char replacements measured ~20x slower.
     escaped = md.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
     return f"<pre>{escaped}</pre>"
 
 
+def _cql_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+@mcp.tool()
+def confluence_get_pages_by_titles(space_key: str, titles: List[str]) -> Dict[str, Any]:
+    """
+    Find several pages by title in a space with one CQL search per 25 titles.
+    Returns {title: {id, version, url}} for the titles that were found.
+
+    Search reads from Confluence's index, which can lag behind very recent
+    creates/renames; use confluence_get_page_by_title before creating a page.
+    """
+    base, auth = _auth_header()
+
+    wanted = list(dict.fromkeys(titles))
+    found: Dict[str, Any] = {}
+    for i in range(0, len(wanted), CQL_TITLES_PER_SEARCH):
+        batch = wanted[i:i + CQL_TITLES_PER_SEARCH]
+        title_clause = " or ".join(f"title = {_cql_string(t)}" for t in batch)
+        cql = f"space = {_cql_string(space_key)} and type = page and ({title_clause})"
+
+        # IMPORTANT: URL-encode the CQL so punctuation and unicode (like "–") works
+        url: Optional[str] = (
+            f"{base}/wiki/rest/api/content/search"
+            f"?cql={quote(cql, safe='')}"
+            f"&limit={CQL_SEARCH_LIMIT}"
+            f"&expand=version"
+        )
+        while url:
+            j = http_json("GET", url, auth)
+            for p in j.get("results", []):
+                t = p.get("title")
+                # CQL title matching is looser than equality; keep exact hits only
+                if t in batch and t not in found:
+                    found[t] = {
+                        "id": p.get("id"),
+                        "version": (p.get("version") or {}).get("number"),
+                        "url": (p.get("_links") or {}).get("webui"),
+                    }
+
+            # Near-misses can push exact hits onto later pages
+            links = j.get("_links") or {}
+            if links.get("next") and not all(t in found for t in batch):
+                url = (links.get("base") or f"{base}/wiki") + links["next"]
+            else:
+                url = None
+    return found
+
+
 @mcp.tool()
 def confluence_get_page_by_title(space_key: str, title: str) -> Dict[str, Any]:
     """
@@ -108,6 +172,8 @@ def confluence_get_page_by_title(space_key: str, title: str) -> Dict[str, Any]:
     """
     base, auth = _auth_header()
 
+    # Exact content lookup rather than search: the search index can lag, and
+    # callers use this to decide whether to create or overwrite a page.
     # IMPORTANT: URL-encode title so punctuation and unicode (like "–") works
     safe_title = quote(title, safe="")
 
@@ -117,7 +183,7 @@ def confluence_get_page_by_title(space_key: str, title: str) -> Dict[str, Any]:
         f"&title={safe_title}"
         f"&expand=version"
     )
-    j = http_json("GET", url, [auth])
+    j = http_json("GET", url, auth)
     results = j.get("results", [])
     if not results:
         return {"found": False, "spaceKey": space_key, "title": title}
@@ -157,7 +223,7 @@ def confluence_create_page(
         payload["ancestors"] = [{"id": str(parent_id)}]
 
     url = f"{base}/wiki/rest/api/content"
-    j = http_json("POST", url, [auth], payload)
+    j = http_json("POST", url, auth, payload)
 
     return {
         "created": True,
@@ -169,32 +235,50 @@ def confluence_create_page(
 
 
 @mcp.tool()
-def confluence_overwrite_page(page_id: str, title: str, content_markdown: str) -> Dict[str, Any]:
+def confluence_overwrite_page(
+    page_id: str,
+    title: str,
+    content_markdown: str,
+    known_version: Optional[int] = None,
+) -> Dict[str, Any]:
     """
     Overwrite a page's content while keeping history (Confluence increments version).
+
+    Pass known_version (e.g. "version" from confluence_get_page_by_title) to skip
+    the lookup of the current version. If the page has changed since, the
+    current version is fetched and the update retried once.
     """
     base, auth = _auth_header()
 
-    # Get current version
-    get_url = f"{base}/wiki/rest/api/content/{page_id}?expand=version"
-    current = http_json("GET", get_url, [auth])
-    current_ver = (current.get("version") or {}).get("number")
-    if not current_ver:
-        raise RuntimeError("Could not determine current Confluence page version.")
+    def get_current_version() -> int:
+        get_url = f"{base}/wiki/rest/api/content/{page_id}?expand=version"
+        current = http_json("GET", get_url, auth)
+        current_ver = (current.get("version") or {}).get("number")
+        if not current_ver:
+            raise RuntimeError("Could not determine current Confluence page version.")
+        return int(current_ver)
 
-    new_ver = int(current_ver) + 1
     storage = md_to_confluence_storage(content_markdown)
-
-    payload = {
-        "id": str(page_id),
-        "type": "page",
-        "title": title,
-        "version": {"number": new_ver},
-        "body": {"storage": {"value": storage, "representation": "storage"}},
-    }
-
     put_url = f"{base}/wiki/rest/api/content/{page_id}"
-    updated = http_json("PUT", put_url, [auth], payload)
+
+    def put_version(new_ver: int) -> Dict[str, Any]:
+        payload = {
+            "id": str(page_id),
+            "type": "page",
+            "title": title,
+            "version": {"number": new_ver},
+            "body": {"storage": {"value": storage, "representation": "storage"}},
+        }
+        return http_json("PUT", put_url, auth, payload)
+
+    current_ver = int(known_version) if known_version else get_current_version()
+    try:
+        updated = put_version(current_ver + 1)
+    except RuntimeError as ex:
+        # 409 means our version is stale (page edited since it was read)
+        if "API error 409" not in str(ex):
+            raise
+        updated = put_version(get_current_version() + 1)
 
     return {
         "updated": True,